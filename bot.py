@@ -1,21 +1,36 @@
 import asyncio
+import contextlib
 import html
-import json
 import logging
 import os
 import re
+import signal
 import sys
+import time
 from datetime import datetime
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
 
 import aiohttp
-import pytz
-import rebrick
+import aiosqlite
+import orjson
+from aiohttp import web
+from cachetools import TTLCache
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ChatType, ParseMode
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
 from aiogram.filters import Command
 from aiogram.types import BufferedInputFile
 from aiogram.types import LinkPreviewOptions
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
+log = logging.getLogger("bot")
 
 dp = Dispatcher()
 
@@ -27,29 +42,199 @@ if not REBRICK_TOKEN:
 if not TELEGRAM_BOT_TOKEN:
     raise RuntimeError("TELEGRAM_BOT_TOKEN env var is empty")
 
-rebrick.init(REBRICK_TOKEN)
-bot = Bot(TELEGRAM_BOT_TOKEN)
+REBRICK_API_URL = "https://rebrickable.com/api/v3/lego"
+REBRICK_HEADERS = {"Authorization": f"key {REBRICK_TOKEN}", "Accept": "application/json"}
+FILE_ID_DB = os.getenv("FILE_ID_DB", "data/file_ids.sqlite3").strip()
+FILE_ID_TTL = 30 * 86400
+# Reply with a MOC link when a 6-digit id isn't a known set
+_moc_fallback = os.getenv("ENABLE_MOC_FALLBACK", "").strip().lower() or "1"
+if _moc_fallback not in ("1", "true", "yes", "on", "0", "false", "no", "off"):
+    raise RuntimeError("ENABLE_MOC_FALLBACK env var must be one of 1/true/yes/on or 0/false/no/off")
+ENABLE_MOC_FALLBACK: bool = _moc_fallback in ("1", "true", "yes", "on")
+
+# Webhook mode is used when WEBHOOK_URL is set (public https base behind a TLS terminator),
+# otherwise the bot falls back to long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip().rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook").strip()
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip() or None
+# Telegram's allowed format for secret_token
+WEBHOOK_SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0").strip()
+_port = os.getenv("WEBHOOK_PORT", "80").strip()
+
+if WEBHOOK_URL and not WEBHOOK_URL.startswith("https://"):
+    raise RuntimeError("WEBHOOK_URL env var must start with https://")
+if WEBHOOK_URL and not WEBHOOK_SECRET:
+    # without it anyone who finds the endpoint can post forged updates
+    raise RuntimeError("WEBHOOK_SECRET env var is required when WEBHOOK_URL is set")
+if WEBHOOK_SECRET and not WEBHOOK_SECRET_RE.fullmatch(WEBHOOK_SECRET):
+    raise RuntimeError("WEBHOOK_SECRET env var must be 1-256 characters of A-Z, a-z, 0-9, _ and -")
+if not WEBHOOK_PATH.startswith("/"):
+    raise RuntimeError("WEBHOOK_PATH env var must start with /")
+if not _port.isdigit():
+    raise RuntimeError("WEBHOOK_PORT env var must be a number")
+WEBHOOK_PORT: int = int(_port)
+
+# Telegram API request timeout, seconds (aiogram default is 60, long polling adds its own wait on top)
+TELEGRAM_TIMEOUT = 15
+# Multipart photo upload of the fallback path can be several MB, give it more time
+TELEGRAM_UPLOAD_TIMEOUT = 60
+
+telegram_session = AiohttpSession(limit=256, timeout=TELEGRAM_TIMEOUT)
+# update() keeps aiogram's own ssl context and ttl_dns_cache workaround
+telegram_session._connector_init.update(limit_per_host=64, keepalive_timeout=75)
+bot = Bot(TELEGRAM_BOT_TOKEN, session=telegram_session)
+
+# set_id -> (caption html, image url); set metadata practically never changes
+SET_CACHE: TTLCache[int, tuple[str, str]] = TTLCache(maxsize=4096, ttl=86400)
+# set_id -> True for ids Rebrickable answered 404, so bad ids don't hammer the API
+NOT_FOUND_CACHE: TTLCache[int, bool] = TTLCache(maxsize=1024, ttl=600)
+# set_id -> Telegram file_id of the already uploaded photo (persisted in FILE_ID_DB)
+FILE_ID_CACHE: TTLCache[int, str] = TTLCache(maxsize=8192, ttl=FILE_ID_TTL)
+FILE_ID_CONN: aiosqlite.Connection | None = None
+# image source (host + path prefix) -> recent "wrong type" refusals by Telegram to fetch a URL
+# from it; reset on a successful URL send, and forgotten an hour after the last failure
+BAD_IMAGE_SOURCES: TTLCache[str, int] = TTLCache(maxsize=256, ttl=3600)
+BAD_IMAGE_SOURCE_THRESHOLD = 3
+# set_id -> future with (caption html, image url) of the Rebrickable lookup in progress
+INFLIGHT: dict[int, asyncio.Future] = {}
+
+# Telegram's size limit for photos sent as a file
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# Shared HTTP session for Rebrickable API and CDN (created in main(), reuses keep-alive connections)
+SESSION: aiohttp.ClientSession | None = None
+
+_TZ = ZoneInfo("Etc/GMT-1")  # Europe/Belgrade ~= GMT+1
+_TS_FMT = "%d.%m.%Y %H:%M:%S"
+
+
+class SetNotFound(Exception):
+    def __init__(self, set_id: int | str):
+        super().__init__(f"Set {set_id} not found (404)")
+        self.set_id = set_id
+
+
+class LookupCancelled(Exception):
+    """The task doing a coalesced set lookup was cancelled before it finished."""
 
 
 # -----------------------------
 # Helpers
 # -----------------------------
-async def get_current_timestamp() -> str:
-    tz = pytz.timezone("Etc/GMT-1")  # Europe/Belgrade ~= GMT+1
-    now_utc = datetime.now(pytz.utc)
-    return now_utc.astimezone(tz).strftime("%d.%m.%Y %H:%M:%S")
+def tz_converter(timestamp: float) -> time.struct_time:
+    # logging.Formatter converter: log timestamps in _TZ regardless of the host timezone
+    return datetime.fromtimestamp(timestamp, _TZ).timetuple()
+
+
+def image_source(url: str) -> str:
+    # e.g. "cdn.rebrickable.com/media/sets" — keeps set images apart from user uploads on the same host
+    parts = urlsplit(url)
+    prefix = "/".join(parts.path.split("/")[:3])
+    return f"{parts.netloc}{prefix}"
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    return aiohttp.ClientSession(
+        headers={"User-Agent": "Mozilla/5.0 (compatible; LegoBot/1.0)"},
+        timeout=aiohttp.ClientTimeout(total=20),
+        connector=aiohttp.TCPConnector(
+            limit=50,
+            limit_per_host=20,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        ),
+    )
+
+
+async def fetch_image_bytes(url: str) -> bytearray:
+    async with SESSION.get(url, allow_redirects=True) as resp:
+        resp.raise_for_status()
+        ct = resp.headers.get("Content-Type", "")
+        if not ct.startswith("image/"):
+            sample = await resp.text(errors="ignore")
+            raise ValueError(f"Not an image. Content-Type={ct}. Sample={sample[:120]!r}")
+
+        # Stream into a buffer pre-sized from Content-Length instead of joining chunks;
+        # slice assignment still grows it if the header was missing or wrong.
+        # The header is untrusted, so cap it at what Telegram accepts for a photo anyway.
+        size = resp.content_length or 0
+        if size > MAX_IMAGE_BYTES:
+            raise ValueError(f"Image too large: Content-Length={size}")
+        buf = bytearray(size)
+        pos = 0
+        async for chunk in resp.content.iter_chunked(65536):
+            if pos + len(chunk) > MAX_IMAGE_BYTES:
+                raise ValueError(f"Image too large: more than {MAX_IMAGE_BYTES} bytes")
+            buf[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+        del buf[pos:]
+        # BufferedInputFile only wraps it in BytesIO, so bytearray is fine as is
+        return buf
+
+
+async def fetch_set(set_id: int | str) -> dict:
+    set_num = str(set_id)
+    if "-" not in set_num:
+        set_num = f"{set_num}-1"
+
+    async with SESSION.get(f"{REBRICK_API_URL}/sets/{set_num}/", headers=REBRICK_HEADERS) as resp:
+        if resp.status == 404:
+            raise SetNotFound(set_id)
+        resp.raise_for_status()
+        return await resp.json(loads=orjson.loads)
+
+
+async def open_file_id_db() -> aiosqlite.Connection:
+    if os.path.dirname(FILE_ID_DB):
+        os.makedirs(os.path.dirname(FILE_ID_DB), exist_ok=True)
+    conn = await aiosqlite.connect(FILE_ID_DB)
+    await conn.execute(
+        "CREATE TABLE IF NOT EXISTS file_ids ("
+        "set_id INTEGER PRIMARY KEY, file_id TEXT NOT NULL, saved_at REAL NOT NULL)"
+    )
+    await conn.execute("DELETE FROM file_ids WHERE saved_at < ?", (time.time() - FILE_ID_TTL,))
+    await conn.commit()
+
+    rows = await conn.execute_fetchall("SELECT set_id, file_id FROM file_ids ORDER BY saved_at")
+    for set_id, file_id in rows:
+        FILE_ID_CACHE[set_id] = file_id
+    return conn
+
+
+async def remember_file_id(set_id: int, msg: types.Message) -> None:
+    if not msg.photo:
+        return
+    file_id = msg.photo[-1].file_id
+    FILE_ID_CACHE[set_id] = file_id
+    if FILE_ID_CONN is not None:
+        await FILE_ID_CONN.execute(
+            "INSERT OR REPLACE INTO file_ids (set_id, file_id, saved_at) VALUES (?, ?, ?)",
+            (set_id, file_id, time.time()),
+        )
+        await FILE_ID_CONN.commit()
 
 
-async def fetch_image_bytes(url: str) -> bytes:
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; LegoBot/1.0)"}
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(url, allow_redirects=True, timeout=20) as resp:
-            resp.raise_for_status()
-            ct = resp.headers.get("Content-Type", "")
-            if not ct.startswith("image/"):
-                sample = await resp.text(errors="ignore")
-                raise ValueError(f"Not an image. Content-Type={ct}. Sample={sample[:120]!r}")
-            return await resp.read()
+async def forget_file_id(set_id: int) -> None:
+    FILE_ID_CACHE.pop(set_id, None)
+    if FILE_ID_CONN is not None:
+        await FILE_ID_CONN.execute("DELETE FROM file_ids WHERE set_id = ?", (set_id,))
+        await FILE_ID_CONN.commit()
+
+
+def is_bad_file_id_error(error: TelegramBadRequest) -> bool:
+    s = str(error).lower()
+    return "file identifier" in s or "file reference" in s or "file_id" in s
+
+
+SET_CAPTION_TEMPLATE = (
+    "ID: <b>{set_num}</b>\n"
+    "Название: <b>{name}</b> ({year})\n"
+    "Деталей: <b>{parts}</b>\n"
+    "\n"
+    "{rebrickable_line}"
+    '🧱 <a href="{lego_url}">Lego</a> <i></i>'
+)
 
 
 def format_set_html(data: dict) -> tuple[str, str]:
@@ -60,7 +245,7 @@ def format_set_html(data: dict) -> tuple[str, str]:
     set_img_url = str(data.get("set_img_url", "")).strip()
 
     raw_set_num = str(data.get("set_num", "")).strip()
-    m = re.match(r"(\d+)", raw_set_num)
+    m = SET_NUM_PREFIX_RE.match(raw_set_num)
     set_num_clean = m.group(1) if m else raw_set_num
 
     set_num_e = html.escape(set_num_clean)
@@ -73,15 +258,17 @@ def format_set_html(data: dict) -> tuple[str, str]:
     lego_url = f"https://www.lego.com/en-us/search?q={set_num_clean}"
     lego_url_e = html.escape(lego_url, quote=True)
 
-    lines = [
-        f"ID: <b>{set_num_e}</b>",
-        f"Название: <b>{name_e}</b> ({year_s})",
-        f"Деталей: <b>{parts_s}</b>\n",
-        f'🔗 <a href="{set_url_e}"><b>Rebrickable</b></a>' if set_url else "",
-        f'🧱 <a href="{lego_url_e}">Lego</a> <i></i>',
-    ]
+    rebrickable_line = f'🔗 <a href="{set_url_e}"><b>Rebrickable</b></a>\n' if set_url else ""
 
-    return "\n".join([ln for ln in lines if ln != ""]), set_img_url
+    text = SET_CAPTION_TEMPLATE.format(
+        set_num=set_num_e,
+        name=name_e,
+        year=year_s,
+        parts=parts_s,
+        rebrickable_line=rebrickable_line,
+        lego_url=lego_url_e,
+    )
+    return text, set_img_url
 
 
 def normalize_bot_username(u: str) -> str:
@@ -91,21 +278,27 @@ def normalize_bot_username(u: str) -> str:
     return u
 
 
-def extract_group_set_id(text: str, bot_username: str) -> int | None:
+BOT_USERNAME = normalize_bot_username(os.getenv("TELEGRAM_BOT_USERNAME", "rebrickable_bot"))
+BOT_MENTION_LOWER = f"@{BOT_USERNAME.lower()}"
+
+GROUP_RE = re.compile(rf"@{re.escape(BOT_USERNAME)}\s+(\d+)(?:-\d+)?", re.IGNORECASE)
+PRIVATE_RE = re.compile(r"^\s*(\d+)(?:-\d+)?\s*$")
+SET_NUM_PREFIX_RE = re.compile(r"(\d+)")
+
+
+def extract_group_set_id(text: str) -> int | None:
     """
     Trigger in groups:
       @botname 12345
       @botname 12345-1
     """
-    if not text:
+    if not text or not BOT_USERNAME:
         return None
-
-    u = normalize_bot_username(bot_username)
-    if not u:
+    # cheap prefilter: most group messages don't mention the bot at all
+    if "@" not in text or BOT_MENTION_LOWER not in text.lower():
         return None
 
-    pattern = rf"@{re.escape(u)}\s+(\d+)(?:-\d+)?"
-    m = re.search(pattern, text, flags=re.IGNORECASE)
+    m = GROUP_RE.search(text)
     return int(m.group(1)) if m else None
 
 
@@ -117,7 +310,13 @@ def extract_private_set_id(text: str) -> int | None:
     """
     if not text:
         return None
-    m = re.match(r"^\s*(\d+)(?:-\d+)?\s*$", text)
+    s = text.strip()
+    # plain "12345" is by far the most common input — no regex needed
+    if s.isdecimal():
+        return int(s)
+    if not s[:1].isdecimal():
+        return None
+    m = PRIVATE_RE.match(text)
     return int(m.group(1)) if m else None
 
 
@@ -130,39 +329,115 @@ def moc_url_for_id(moc_id: int) -> str:
     return f"https://rebrickable.com/mocs/MOC-{moc_id}/"
 
 
-def is_not_found_error(err_text: str) -> bool:
-    s = (err_text or "").lower()
-    return ("404" in s) or ("not found" in s)
+async def get_set_caption(set_id: int) -> tuple[str, str]:
+    if set_id in NOT_FOUND_CACHE:
+        raise SetNotFound(set_id)
 
+    if (cached := SET_CACHE.get(set_id)) is not None:
+        return cached
 
-async def send_set(message: types.Message, set_id: int):
-    response = rebrick.lego.get_set(set_id)  # может кинуть исключение на 404
-    data = json.loads(response.read())
-    text, image_url = format_set_html(data)
+    # Same set requested concurrently — wait for the lookup already in progress
+    if (fut := INFLIGHT.get(set_id)) is not None:
+        try:
+            return await asyncio.shield(fut)
+        except LookupCancelled:
+            # its owner went away, not the lookup itself failed — do it ourselves
+            return await get_set_caption(set_id)
 
-    # 1) Fast: try direct URL
+    fut = asyncio.get_running_loop().create_future()
+    INFLIGHT[set_id] = fut
     try:
-        await bot.send_photo(
-            message.chat.id,
-            photo=image_url,
-            caption=text,
-            parse_mode=ParseMode.HTML,
-        )
-        return
-    except TelegramBadRequest as e:
-        # Only fallback for CDN content-type issues
-        if "wrong type of the web page content" not in str(e):
+        try:
+            data = await fetch_set(set_id)
+        except SetNotFound:
+            NOT_FOUND_CACHE[set_id] = True
+            raise
+        result = format_set_html(data)
+        SET_CACHE[set_id] = result
+        fut.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        # don't cancel the shared future: waiters would end silently without a reply
+        fut.set_exception(LookupCancelled(set_id))
+        fut.exception()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # mark as retrieved, there may be no one else waiting
+        raise
+    finally:
+        del INFLIGHT[set_id]
+
+
+async def send_set(message: types.Message, set_id: int):
+    text, image_url = await get_set_caption(set_id)
+
+    # 0) Fastest: photo was already uploaded to Telegram, reuse its file_id
+    if (file_id := FILE_ID_CACHE.get(set_id)) is not None:
+        try:
+            await bot.send_photo(
+                message.chat.id,
+                photo=file_id,
+                caption=text,
+                parse_mode=ParseMode.HTML,
+            )
+            return
+        except TelegramBadRequest as e:
+            # Only a stale/invalid file_id is worth re-uploading; chat/rights/caption errors would repeat
+            if not is_bad_file_id_error(e):
+                raise
+            await forget_file_id(set_id)
+
+    # 1) Fast: try direct URL (unless Telegram keeps failing on this image source)
+    source = image_source(image_url)
+    prefetch: asyncio.Task | None = None
+    if BAD_IMAGE_SOURCES.get(source, 0) < BAD_IMAGE_SOURCE_THRESHOLD:
+        # download the image in parallel, so the fallback below doesn't have to wait for it
+        prefetch = asyncio.create_task(fetch_image_bytes(image_url))
+        # retrieve the outcome so an unused failed prefetch isn't logged as "never retrieved"
+        prefetch.add_done_callback(lambda t: t.cancelled() or t.exception())
+        try:
+            msg = await bot.send_photo(
+                message.chat.id,
+                photo=image_url,
+                caption=text,
+                parse_mode=ParseMode.HTML,
+            )
+            prefetch.cancel()
+            BAD_IMAGE_SOURCES.pop(source, None)
+            await remember_file_id(set_id, msg)
+            return
+        except TelegramBadRequest as e:
+            # Only fallback for CDN content-type issues
+            if "wrong type of the web page content" not in str(e):
+                prefetch.cancel()
+                raise
+            BAD_IMAGE_SOURCES[source] = BAD_IMAGE_SOURCES.get(source, 0) + 1
+        except TelegramNetworkError as e:
+            # Only a timeout means Telegram stalled fetching the URL; connection/DNS errors
+            # would hit the same unreachable API again with the upload
+            if not isinstance(e.__cause__, asyncio.TimeoutError):
+                prefetch.cancel()
+                raise
+            # Upload the bytes ourselves instead. Trade-off: on a read timeout Telegram may
+            # still have delivered the URL photo, so the user can occasionally get it twice;
+            # better than no reply at all.
+            log.warning("send_photo by URL timed out for set %s, uploading the image", set_id)
+        except BaseException:
+            prefetch.cancel()
             raise
 
     # 2) Fallback: download & upload bytes
-    img_bytes = await fetch_image_bytes(image_url)
+    img_bytes = await prefetch if prefetch is not None else await fetch_image_bytes(image_url)
     photo = BufferedInputFile(img_bytes, filename="set.jpg")
-    await bot.send_photo(
+    msg = await bot.send_photo(
         message.chat.id,
         photo=photo,
         caption=text,
         parse_mode=ParseMode.HTML,
+        request_timeout=TELEGRAM_UPLOAD_TIMEOUT,
     )
+    await remember_file_id(set_id, msg)
 
 
 # -----------------------------
@@ -174,7 +449,7 @@ async def start_handler(message: types.Message) -> None:
         return
     await message.answer(
         "Пришли номер набора, например <b>42177</b>\n"
-        "В группах: @rebrickable_bot 42177\nВопросы: @pycarrot2",
+        f"В группах: @{BOT_USERNAME} 42177\nВопросы: @pycarrot2",
         parse_mode="HTML",
     )
 
@@ -183,8 +458,7 @@ async def start_handler(message: types.Message) -> None:
 async def unified_message_handler(message: types.Message):
     try:
         if message.chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
-            bot_username = os.getenv("TELEGRAM_BOT_USERNAME", "rebrickable_bot")
-            set_id = extract_group_set_id(message.text or "", bot_username)
+            set_id = extract_group_set_id(message.text or "")
             if not set_id:
                 return
             await send_set(message, set_id)
@@ -205,21 +479,26 @@ async def unified_message_handler(message: types.Message):
     except Exception as error:
         err = str(error)
         chat_name = getattr(message.chat, "title", None) or message.chat.full_name
-        print(f"{await get_current_timestamp()}|{chat_name}|{message.chat.id} - {err}")
+        not_found = isinstance(error, SetNotFound)
+        if not_found:
+            # expected for typos / MOC ids, no traceback needed
+            log.info("%s|%s - %s", chat_name, message.chat.id, err)
+        else:
+            log.exception("%s|%s - %s", chat_name, message.chat.id, err)
 
         # если набора нет — пробуем “это MOC?” => отправляем ссылку
-        if is_not_found_error(err):
+        if not_found:
             # set_id у нас уже вытащен из текста (число)
             # но на всякий случай — выковыряем число из исходного сообщения тоже
             raw = (message.text or "").strip()
-            m = re.search(r"(\d+)", raw)
+            m = SET_NUM_PREFIX_RE.search(raw)
             num_s = m.group(1) if m else ""
             try:
                 num = int(num_s) if num_s else None
             except ValueError:
                 num = None
 
-            if num is not None and looks_like_moc_id(num):
+            if ENABLE_MOC_FALLBACK and num is not None and looks_like_moc_id(num):
                 url = moc_url_for_id(num)
                 await bot.send_message(
                     message.chat.id,
@@ -243,10 +522,62 @@ async def unified_message_handler(message: types.Message):
             return
 
 
-async def main() -> None:
+async def run_webhook() -> None:
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    # start_polling installs these itself; without them `docker stop` would skip the cleanup below
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):  # not supported on Windows
+            loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT).start()
+        # register only once we're listening, so Telegram's first POST doesn't hit a closed port
+        await bot.set_webhook(
+            f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            drop_pending_updates=True,
+            secret_token=WEBHOOK_SECRET,
+        )
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_polling() -> None:
+    # getUpdates doesn't work while a webhook is registered
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 
+async def main() -> None:
+    global SESSION, FILE_ID_CONN
+    FILE_ID_CONN = await open_file_id_db()
+    SESSION = create_http_session()
+    try:
+        if WEBHOOK_URL:
+            await run_webhook()
+        else:
+            await run_polling()
+    finally:
+        await SESSION.close()
+        await FILE_ID_CONN.close()
+
+
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    asyncio.run(main())
\ No newline at end of file
+    logging.Formatter.converter = staticmethod(tz_converter)
+    logging.basicConfig(
+        level=logging.INFO,
+        stream=sys.stdout,
+        format="%(asctime)s|%(message)s",
+        datefmt=_TS_FMT,
+    )
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file